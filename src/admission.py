@@ -0,0 +1,197 @@
+"""
+Memory-aware admission control for running folding jobs concurrently.
+Each job's peak memory is predicted from a per-tool power law fitted on earlier benchmark measurements,
+and a job is only started once its predicted peak fits in the remaining memory budget.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Callable, Iterable
+import itertools
+import threading
+import numpy as np
+import psutil
+from bridge import CensoredResult, FoldResult, ResourceLimits
+
+TOOLS = ["lineardesign", "cdsfold", "derna", "mrnafold"]
+
+
+def load_memory_measurements(paths: Iterable[str]) -> dict[str, list[tuple[int, int]]]:
+    """
+    Reads the "<tool> memory(bytes):" lines from benchmark.py output files.
+    Returns a map from tool to (aa_len, peak memory in bytes) pairs.
+    """
+    measurements = {tool: [] for tool in TOOLS}
+    for path in paths:
+        aa_len = None
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("aa_len:"):
+                    aa_len = int(line.split(":")[1].strip())
+                elif " memory(bytes):" in line:
+                    tool = line.split(" memory(bytes):")[0]
+                    measurements[tool].append((aa_len, int(line.split(":")[1].strip())))
+    return measurements
+
+
+def fit_power_law(pts: list[tuple[int, float]]) -> tuple[float, float]:
+    """
+    Fits y = a * x^b to (x, y) points by least squares in log-log space. Returns (a, b).
+    With fewer than two distinct x values, y is assumed to be linear in x.
+    """
+    xs = np.array([p[0] for p in pts], dtype=float)
+    ys = np.array([max(p[1], 1e-9) for p in pts], dtype=float)
+    if len(set(xs)) < 2:
+        b = 1.0
+        log_a = np.mean(np.log(ys) - np.log(xs))
+    else:
+        b, log_a = np.polyfit(np.log(xs), np.log(ys), 1)
+    return float(np.exp(log_a)), float(b)
+
+
+class MemoryModel:
+    """
+    Predicts the peak memory of a tool run from the protein length.
+    Fits memory = a * aa_len^b per tool by least squares in log-log space, on the upper half of the measured
+    lengths, where the asymptotic cost dominates any fixed overhead. Predictions are scaled up so that they cover
+    the measurements at the neighbouring_lengths measured lengths nearest the one predicted, and then by a further
+    safety factor.
+    """
+
+    def __init__(self, measurements: dict[str, list[tuple[int, int]]], safety_factor: float = 1.2,
+                 neighbouring_lengths: int = 3):
+        self._measurements = {tool: list(pts) for tool, pts in measurements.items()}
+        self._safety_factor = safety_factor
+        self._neighbouring_lengths = neighbouring_lengths
+        self._fits = {}
+        for tool in self._measurements:
+            self._fit(tool)
+
+    def _fit(self, tool: str):
+        pts = self._measurements[tool]
+        if not pts:
+            self._fits.pop(tool, None)
+            return
+        lens = sorted({p[0] for p in pts})
+        min_fit_len = lens[len(lens) // 2] if len(lens) >= 4 else lens[0]
+        a, b = fit_power_law([p for p in pts if p[0] >= min_fit_len])
+        # The largest ratio of measured to fitted memory at each measured length
+        headroom = {}
+        for aa_len, mem in pts:
+            headroom[aa_len] = max(headroom.get(aa_len, 0.0), mem / (a * aa_len**b))
+        self._fits[tool] = (a, b, headroom)
+
+    def observe(self, tool: str, aa_len: int, memory_bytes: int):
+        """Adds a new measurement and refits the tool's model"""
+        self._measurements.setdefault(tool, []).append((aa_len, memory_bytes))
+        self._fit(tool)
+
+    def predict(self, tool: str, aa_len: int) -> int:
+        """Predicted peak memory in bytes of running tool on a protein of length aa_len"""
+        if tool not in self._fits:
+            raise KeyError(f"No memory measurements for {tool}")
+        a, b, headroom = self._fits[tool]
+        # Scale the fit so that it does not under-predict the measurements near aa_len
+        nearest = sorted(headroom, key=lambda x: abs(x - aa_len))[:self._neighbouring_lengths]
+        scale = max(1.0, max(headroom[x] for x in nearest))
+        return int(a * aa_len**b * scale * self._safety_factor)
+
+
+class AdmissionController:
+    """
+    Tracks how much of a memory budget is reserved by running jobs.
+    Jobs are admitted in the order they arrive, each once its predicted peak memory fits in the unreserved
+    budget, and release their reservation when they finish. A job predicted to need more than the whole budget
+    is admitted once nothing else is running. Since later jobs queue behind a waiting job rather than
+    overtaking it, no job can be starved by a stream of smaller ones.
+    """
+
+    def __init__(self, model: MemoryModel, budget_bytes: int | None = None):
+        self.model = model
+        self.budget_bytes = budget_bytes if budget_bytes is not None else psutil.virtual_memory().available
+        self._reserved = 0
+        self._running = 0
+        self._tickets = itertools.count()
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    @property
+    def reserved_bytes(self) -> int:
+        with self._cond:
+            return self._reserved
+
+    def observe(self, tool: str, aa_len: int, memory_bytes: int):
+        """Feeds a measured peak memory back into the model, for jobs admitted after this"""
+        with self._cond:
+            self.model.observe(tool, aa_len, memory_bytes)
+
+    def _fits(self, need: int) -> bool:
+        return self._reserved + need <= self.budget_bytes or self._running == 0
+
+    @contextmanager
+    def reserve(self, tool: str, aa_len: int):
+        """
+        Blocks until the job fits in the budget, then holds its reservation for the duration of the block.
+        Yields the number of bytes reserved.
+        """
+        with self._cond:
+            need = self.model.predict(tool, aa_len)
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            try:
+                self._cond.wait_for(lambda: self._queue[0] == ticket and self._fits(need))
+            finally:
+                self._queue.remove(ticket)
+                # Let the next job in the queue check whether it fits too
+                self._cond.notify_all()
+            self._reserved += need
+            self._running += 1
+        try:
+            yield need
+        finally:
+            with self._cond:
+                self._reserved -= need
+                self._running -= 1
+                self._cond.notify_all()
+
+
+def run_admitted(controller: AdmissionController,
+                 jobs: Iterable[tuple[str, int, Callable[[ResourceLimits], FoldResult]]],
+                 max_workers: int, limits: ResourceLimits | None = None) -> list[Future]:
+    """
+    Runs jobs concurrently on up to max_workers threads, admitting each through controller.
+    Each job is a (tool, aa_len, call) triple, where call runs the tool under the limits it is given.
+    Those are limits with the memory cap set to the job's reservation, so a job that needs more than
+    predicted is censored rather than pushing the host out of memory. Like the measurements the reservation is
+    predicted from, the cap is on resident memory, so threaded tools with a large virtual size are not affected.
+    Measured peak memory of completed runs is fed back into the model.
+    Returns a future per job, in the order given.
+    """
+    limits = limits or ResourceLimits()
+
+    def run(tool: str, aa_len: int, call: Callable[[ResourceLimits], FoldResult]) -> FoldResult:
+        with controller.reserve(tool, aa_len) as need:
+            res = call(replace(limits, memory_bytes=need))
+        if not isinstance(res, CensoredResult):
+            controller.observe(tool, aa_len, res.memory_bytes)
+        return res
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [executor.submit(run, tool, aa_len, call) for tool, aa_len, call in jobs]
+    executor.shutdown(wait=False)
+    return futures
+
+
+def main():
+    measurements = load_memory_measurements(
+        [f"../data/bench_runs/{name}{i}.txt" for name in ["random", "mll"] for i in range(1, 4)]
+    )
+    model = MemoryModel(measurements)
+    for tool in TOOLS:
+        predictions = [f"{aa_len}: {model.predict(tool, aa_len) / 1024**3:.2f}GB" for aa_len in [250, 500, 1000, 1500]]
+        print(tool, ", ".join(predictions))
+
+
+if __name__ == "__main__":
+    main()
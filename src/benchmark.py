@@ -3,8 +3,13 @@ from bridge import (
     call_mrnafold,
     call_lineardesign,
     call_derna,
-    FoldException,
+    call_with_retries,
+    CensoredResult,
+    ResourceLimits,
+    RetryPolicy,
 )
+from collections import Counter
+from metrics import BenchmarkMetrics
 import random
 import protein
 import argparse as ap
@@ -24,6 +29,12 @@ def main():
     parser.add_argument(
         "--timeout", type=int, default=3600, help="Timeout in seconds for each tool"
     )
+    parser.add_argument(
+        "--memory_limit",
+        type=float,
+        default=None,
+        help="Memory limit in GB for each tool run. Unlimited by default",
+    )
     parser.add_argument("--seed", type=int, default=0, help="Seed for random sequences")
     parser.add_argument(
         "--codon_table",
@@ -37,15 +48,78 @@ def main():
         default="../extern/",
         help="Root directory for the binaries. Where the mRNA folding programs are located",
     )
+    parser.add_argument(
+        "--max_attempts",
+        type=int,
+        default=10,
+        help="Maximum number of LinearDesign attempts per length in random mode",
+    )
+    parser.add_argument(
+        "--crash_corpus",
+        type=str,
+        default="../data/crash_corpus.csv",
+        help="Path to the csv file every crashing input is appended to",
+    )
+    parser.add_argument(
+        "--metrics_file",
+        type=str,
+        default=None,
+        help="Path of a Prometheus text file that live progress metrics are periodically written to",
+    )
     args = parser.parse_args()
 
     cft = protein.CodonFrequencyTable(args.codon_table)
     random.seed(args.seed)
-    timeout_s = args.timeout
+    limits = ResourceLimits(
+        time_s=args.timeout,
+        memory_bytes=None if args.memory_limit is None else int(args.memory_limit * 1024**3),
+    )
     random_seq = args.mode == "random"
 
-    derna_mx = 0
-    cds_mx = 0
+    # Tools that hit a limit are not run at longer lengths, since their cost only grows with length
+    censored_tools = set()
+    # Tool failures are recorded rather than aborting the benchmark. Only LinearDesign on random sequences
+    # is retried, since it is the only case where a new input can be drawn; the other tools are deterministic.
+    # Its failures depend on the input rather than on transient conditions, so retries are not delayed
+    fail_once = RetryPolicy(max_attempts=1, crash_corpus=args.crash_corpus)
+    lineardesign_policy = RetryPolicy(
+        max_attempts=args.max_attempts if random_seq else 1, crash_corpus=args.crash_corpus, backoff_s=0
+    )
+
+    lengths = range(50, 1501, 50)
+    metrics = None
+    if args.metrics_file is not None:
+        metrics = BenchmarkMetrics(
+            args.metrics_file, ["lineardesign", "cdsfold", "derna", "mrnafold"], lengths
+        )
+        metrics.start()
+
+    def run(tool: str, call, next_seq, policy: RetryPolicy) -> str:
+        """Runs and reports a tool. Returns the sequence it was run on"""
+        if metrics is not None:
+            metrics.job_started(tool, aa_len)
+        outcome = call_with_retries(tool, call, next_seq, policy)
+        res = outcome.result
+        if metrics is not None:
+            metrics.job_finished(tool, aa_len, res)
+        if outcome.failures:
+            kinds = Counter(e.kind for e in outcome.failures)
+            print(
+                f"{tool} failures: {len(outcome.failures)}/{outcome.attempts}",
+                f"({', '.join(f'{k}: {n}' for k, n in sorted(kinds.items()))})",
+                flush=True,
+            )
+        if isinstance(res, CensoredResult):
+            print(f"{tool} censored({res.limit}):", res.limit_value, flush=True)
+            censored_tools.add(tool)
+            if metrics is not None:
+                metrics.tool_stopped(tool)
+        elif res is not None:
+            print(f"{tool} time(s):", res.time_s)
+            print(f"{tool} memory(bytes):", res.memory_bytes, flush=True)
+        else:
+            print(f"{tool} failed", flush=True)
+        return outcome.aa_seq
 
     def gen_ml_seq(sz: int) -> str:
         return "M" + "L" * (sz - 1)
@@ -53,50 +127,62 @@ def main():
     def gen_seq(sz: int) -> str:
         return protein.random_aa_seq(sz) if random_seq else gen_ml_seq(sz)
 
-    for aa_len in range(50, 1501, 50):
+    for aa_len in lengths:
         print("aa_len:", aa_len)
 
-        # LinearDesign tends to fail an assert and crash, so retry until it works
-        while True:
+        # LinearDesign tends to fail an assert and crash, so retry it on fresh sequences.
+        # The other tools are run on whichever sequence LinearDesign was last run on
+        if "lineardesign" in censored_tools:
             aa_seq = gen_seq(aa_len)
-            try:
-                linear_res = call_lineardesign(
-                    cft, os.path.join(args.bin_root, "LinearDesign-main/"), aa_seq
-                )
-            except FoldException as e:
-                if random_seq:
-                    print(f"LinearDesign failed with error: {e}. Trying again.")
-                    continue
-                else:
-                    # Can't retry with deterministic sequences
-                    raise e
-            break
-
-        print("lineardesign time(s):", linear_res.time_s)
-        print("lineardesign memory(bytes):", linear_res.memory_bytes, flush=True)
-
-        if cds_mx < timeout_s:
-            cds_res = call_cdsfold(os.path.join(args.bin_root, "CDSfold-main"), aa_seq)
-            print("cdsfold time(s):", cds_res.time_s)
-            print("cdsfold memory(bytes):", cds_res.memory_bytes, flush=True)
-            cds_mx = max(cds_mx, cds_res.time_s)
-
-        if derna_mx < timeout_s:
-            derna_res = call_derna(
-                cft,
-                os.path.join(args.bin_root, "derna-main"),
-                aa_seq,
-                lambda_value=1.0,
+        else:
+            aa_seq = run(
+                "lineardesign",
+                lambda seq: call_lineardesign(
+                    cft, os.path.join(args.bin_root, "LinearDesign-main/"), seq, limits=limits
+                ),
+                lambda: gen_seq(aa_len),
+                lineardesign_policy,
             )
-            print("derna time(s):", derna_res.time_s)
-            print("derna memory(bytes):", derna_res.memory_bytes, flush=True)
-            derna_mx = max(derna_mx, derna_res.time_s)
 
-        mrna_res = call_mrnafold(
-            os.path.join(args.bin_root, "mrnafold-main"), aa_seq, parallel=True
-        )
-        print("mrnafold time(s):", mrna_res.time_s)
-        print("mrnafold memory(bytes):", mrna_res.memory_bytes, flush=True)
+        if "cdsfold" not in censored_tools:
+            run(
+                "cdsfold",
+                lambda seq: call_cdsfold(
+                    os.path.join(args.bin_root, "CDSfold-main"), seq, limits=limits
+                ),
+                lambda: aa_seq,
+                fail_once,
+            )
+
+        if "derna" not in censored_tools:
+            run(
+                "derna",
+                lambda seq: call_derna(
+                    cft,
+                    os.path.join(args.bin_root, "derna-main"),
+                    seq,
+                    lambda_value=1.0,
+                    limits=limits,
+                ),
+                lambda: aa_seq,
+                fail_once,
+            )
+
+        if "mrnafold" not in censored_tools:
+            run(
+                "mrnafold",
+                lambda seq: call_mrnafold(
+                    os.path.join(args.bin_root, "mrnafold-main"),
+                    seq,
+                    parallel=True,
+                    limits=limits,
+                ),
+                lambda: aa_seq,
+                fail_once,
+            )
+
+    if metrics is not None:
+        metrics.stop()
 
 
 if __name__ == "__main__":
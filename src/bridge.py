@@ -1,8 +1,12 @@
 """Bridge code for calling mrna folding algorithms"""
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Sequence
+from typing import Callable, Sequence
 import subprocess
+import csv
+import math
 import threading
+import signal
 import tempfile
 import time
 import os
@@ -10,8 +14,27 @@ import psutil
 import protein
 
 
+# Failure kinds reported by FoldException.kind
+FAILURE_ASSERT = 'assert'
+FAILURE_SEGFAULT = 'segfault'
+FAILURE_PARSE = 'parse'
+FAILURE_TIMEOUT = 'timeout'
+FAILURE_MEMORY = 'memory'
+FAILURE_OTHER = 'other'
+FAILURE_CANCELLED = 'cancelled'
+
+
 class FoldException(Exception):
-    """Exception class for mrna folding algorithms"""
+    """
+    Exception class for mrna folding algorithms.
+    kind is one of the FAILURE_* constants, and returncode and stderr are those of the failed tool run, if any.
+    """
+
+    def __init__(self, msg: str, kind: str = FAILURE_OTHER, returncode: int | None = None, stderr: str = ''):
+        super().__init__(msg)
+        self.kind = kind
+        self.returncode = returncode
+        self.stderr = stderr
 
 
 @dataclass
@@ -25,71 +48,274 @@ class FoldResult:
     memory_bytes: int = -1
 
 
-def monitor_memory_usage(pid: int, memory_log: list[int]):
-    """Monitor memory usage of the process with the given PID. Appends the memory usage to memory_log"""
+@dataclass
+class ResourceLimits:
+    """
+    Per-run resource caps. A value of None means the resource is not limited.
+    memory_bytes caps the resident set size, the same quantity reported as FoldResult.memory_bytes.
+    cpus is the set of CPUs the run is pinned to.
+    """
+    time_s: float | None = None
+    memory_bytes: int | None = None
+    cpus: Sequence[int] | None = None
+
+
+@dataclass
+class CensoredResult(FoldResult):
+    """
+    Result of a run that was killed for exceeding one of its ResourceLimits.
+    Only time_s and memory_bytes are measured; limit names the cap that was hit ('time' or 'memory'),
+    and limit_value is the value of that cap.
+    """
+    limit: str = ''
+    limit_value: float = 0.0
+
+
+class LimitExceeded(FoldException):
+    """Raised by call_subprocess when a run is killed for exceeding a resource limit"""
+
+    def __init__(self, result: CensoredResult):
+        super().__init__(f'Run exceeded its {result.limit} limit of {result.limit_value}',
+                         kind=FAILURE_TIMEOUT if result.limit == 'time' else FAILURE_MEMORY)
+        self.result = result
+
+
+class RunCancelled(FoldException):
+    """Raised by call_subprocess when a run is killed because it was cancelled"""
+
+    def __init__(self):
+        super().__init__('Run was cancelled', kind=FAILURE_CANCELLED)
+
+
+# How often a running subprocess checks whether it has been cancelled
+_CANCEL_POLL_S = 0.1
+
+# tmpfs mount that scratch directories are made in, when it is available
+_TMPFS_ROOT = '/dev/shm'
+
+# stderr signatures of a process that failed to allocate memory
+_ALLOC_FAILURE_SIGNATURES = ('bad_alloc', 'Cannot allocate memory', 'out of memory', 'MemoryError')
+
+
+def kill_process_group(pid: int):
+    """Kills the process group led by pid, ignoring it if it has already exited"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def monitor_memory_usage(pid: int, memory_log: list[int], memory_limit: int | None = None,
+                         exceeded: threading.Event | None = None):
+    """
+    Monitor memory usage of the process with the given PID. Appends the memory usage to memory_log.
+    If memory_limit is given and the resident set size goes over it, the process group is killed and exceeded is set.
+    """
     try:
         process = psutil.Process(pid)
         while process.is_running():
-            memory_log.append(process.memory_info().rss)
+            rss = process.memory_info().rss
+            memory_log.append(rss)
+            if memory_limit is not None and rss > memory_limit:
+                exceeded.set()
+                kill_process_group(pid)
+                return
             time.sleep(0.1)
     except psutil.NoSuchProcess:
         pass
 
 
-def call_subprocess(args: Sequence[str], input_str: str = '') -> tuple[subprocess.CompletedProcess, int, float]:
+def library_env(*lib_dirs: str) -> dict[str, str]:
+    """Returns a copy of this process's environment with lib_dirs prepended to the child's library path"""
+    env = dict(os.environ)
+    paths = [os.path.abspath(d) for d in lib_dirs]
+    if env.get('LD_LIBRARY_PATH'):
+        paths.append(env['LD_LIBRARY_PATH'])
+    env['LD_LIBRARY_PATH'] = os.pathsep.join(paths)
+    return env
+
+
+def mirror_dir(src: str, dst: str):
+    """Symlinks every entry of src into dst, so that paths relative to src also resolve relative to dst"""
+    src = os.path.abspath(src)
+    for entry in os.listdir(src):
+        link = os.path.join(dst, entry)
+        if not os.path.exists(link):
+            os.symlink(os.path.join(src, entry), link)
+
+
+def limit_command(limits: ResourceLimits) -> list[str]:
+    """
+    Returns the command prefix that applies limits to the child, which is taskset for the cpu affinity.
+    taskset execs the command, so the child keeps its pid.
+    Limits are applied this way rather than with a preexec_fn, which can deadlock when this process has threads.
+    """
+    prefix = []
+    if limits.cpus is not None:
+        prefix += ['taskset', '-c', ','.join(map(str, sorted(limits.cpus)))]
+    return prefix
+
+
+def call_subprocess(args: Sequence[str], input_str: str = '', limits: ResourceLimits | None = None,
+                    cwd: str | None = None, env: dict[str, str] | None = None,
+                    cancel: threading.Event | None = None) -> tuple[subprocess.CompletedProcess, int, float]:
     """
-    Calls a subprocess with a timeout and commandline input.
+    Calls a subprocess with commandline input, enforcing the given resource limits.
+    The child runs in cwd with environment env, defaulting to those of this process.
+    The child runs in its own process group, so that it and anything it spawns can be killed together.
+    Wall-clock time is enforced with a timer, and memory with a resident set size watchdog. RLIMIT_AS is not
+    used, since virtual size is far above resident size for threaded tools and would fail them well under the cap.
+    A run that allocates quickly can overshoot the cap by what it allocates between two watchdog polls.
+    The child and its threads are pinned to limits.cpus, if given.
     Returns a tuple of the CompletedProcess, the memory usage in bytes, and the time taken in seconds.
+    Raises LimitExceeded if the run was killed for going over a limit, and RunCancelled if it was killed
+    because cancel was set.
     """
+    limits = limits or ResourceLimits()
     ts = time.time()
     p = subprocess.Popen(
-        args, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
+        limit_command(limits) + list(args), text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        stdin=subprocess.PIPE, cwd=cwd, env=env, start_new_session=True)
     # Launch background thread to monitor memory usage
     memory_log = []
+    memory_exceeded = threading.Event()
     monitor_thread = threading.Thread(
-        target=monitor_memory_usage, args=(p.pid, memory_log))
+        target=monitor_memory_usage, args=(p.pid, memory_log, limits.memory_bytes, memory_exceeded))
     monitor_thread.start()
-    # Send stdin
-    stdout, stderr = p.communicate(input=input_str)
+    # Send stdin, killing the whole process group if it runs over time or is cancelled
+    timed_out = False
+    cancelled = False
+    deadline = None if limits.time_s is None else ts + limits.time_s
+    pending_input = input_str
+    while True:
+        wait = None if cancel is None else _CANCEL_POLL_S
+        if deadline is not None:
+            remaining = max(deadline - time.time(), 0)
+            wait = remaining if wait is None else min(wait, remaining)
+        try:
+            stdout, stderr = p.communicate(input=pending_input, timeout=wait)
+            break
+        except subprocess.TimeoutExpired:
+            # Input can only be sent on the first call to communicate
+            pending_input = None
+            timed_out = deadline is not None and time.time() >= deadline
+            cancelled = not timed_out and cancel is not None and cancel.is_set()
+            if timed_out or cancelled:
+                kill_process_group(p.pid)
+                stdout, stderr = p.communicate()
+                break
     # Wait for the process to finish
     error_code = p.wait()
     te = time.time()
-    return subprocess.CompletedProcess(args, error_code, stdout, stderr), max(memory_log), te-ts
+    monitor_thread.join()
+    mem_b = max(memory_log, default=0)
+
+    if cancelled:
+        raise RunCancelled()
+    censored = None
+    if timed_out:
+        censored = CensoredResult(limit='time', limit_value=limits.time_s)
+    elif memory_exceeded.is_set():
+        censored = CensoredResult(limit='memory', limit_value=limits.memory_bytes)
+    if censored is not None:
+        censored.time_s = te-ts
+        censored.memory_bytes = mem_b
+        raise LimitExceeded(censored)
+    return subprocess.CompletedProcess(args, error_code, stdout, stderr), mem_b, te-ts
+
+
+def classify_failure(returncode: int, stderr: str) -> str:
+    """Classifies a failed tool run by its exit code and stderr. Returns one of the FAILURE_* constants"""
+    if 'Assertion' in stderr or 'assert' in stderr:
+        return FAILURE_ASSERT
+    if returncode in (-signal.SIGSEGV, 128 + signal.SIGSEGV) or 'Segmentation fault' in stderr:
+        return FAILURE_SEGFAULT
+    if any(sig in stderr for sig in _ALLOC_FAILURE_SIGNATURES):
+        return FAILURE_MEMORY
+    return FAILURE_OTHER
+
+
+def check_returncode(tool: str, result: subprocess.CompletedProcess):
+    """Raises a classified FoldException if the tool run failed"""
+    if result.returncode != 0:
+        raise FoldException(f'{tool} failed with return code: '
+                            f'{result.returncode}, and stderror: {result.stderr}',
+                            kind=classify_failure(result.returncode, result.stderr),
+                            returncode=result.returncode, stderr=result.stderr)
 
 
-def make_fasta_file(aa_seq: str) -> str:
+def parse_output(tool: str, parser: Callable[[str], FoldResult], output: str, time_s: float,
+                 memory_bytes: int) -> FoldResult:
+    """
+    Parses the output of a successful tool run with parser, filling in the time and memory usage.
+    Raises a FoldException of kind FAILURE_PARSE if the output is malformed.
+    """
+    try:
+        res = parser(output)
+    except (IndexError, ValueError) as e:
+        raise FoldException(f'{tool} output could not be parsed: {e}', kind=FAILURE_PARSE) from e
+    if not res.rna_seq or len(res.rna_seq) != len(res.db):
+        raise FoldException(f'{tool} output has no valid sequence and structure', kind=FAILURE_PARSE)
+    if math.isinf(res.mfe):
+        raise FoldException(f'{tool} output has no MFE', kind=FAILURE_PARSE)
+    res.time_s = time_s
+    res.memory_bytes = memory_bytes
+    return res
+
+
+@contextmanager
+def scratch_dir():
+    """
+    Creates a private scratch directory for one tool invocation, on tmpfs where available.
+    Every input, output and stray file of the invocation goes in it, and it is deleted with its contents on exit.
+    """
+    root = _TMPFS_ROOT if os.path.isdir(_TMPFS_ROOT) and os.access(_TMPFS_ROOT, os.W_OK) else None
+    with tempfile.TemporaryDirectory(prefix='mrna_fold_', dir=root) as scratch:
+        yield scratch
+
+
+def make_fasta_file(aa_seq: str, scratch: str) -> str:
     """Creates a fasta file in the format"""
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as file:
+    with open(os.path.join(scratch, 'seq.fasta'), 'w', encoding='utf-8') as file:
         file.write('>seq\n')
         file.write(aa_seq)
     return file.name
 
 
-def call_cdsfold(path: str, aa_seq: str) -> FoldResult:
-    """Calls CdsFold via a subprocess"""
-    fasta = make_fasta_file(aa_seq)
-    # result = subprocess.run([os.path.join(
-    #     path, 'src/CDSfold'), fasta], capture_output=True, text=True, check=False)
-    result, mem_b, time_s = call_subprocess(
-        [os.path.join(path, 'src/CDSfold'), fasta])
-
-    # Clean up tmp file
-    os.remove(fasta)
-
-    if result.returncode != 0:
-        raise FoldException(f"CdsFold failed with return code: "
-                            f"{result.returncode}, and stderror: {result.stderr}")
-    ret = FoldResult(time_s=time_s, memory_bytes=mem_b)
-    lns = result.stdout.split('\n')
+def call_cdsfold(path: str, aa_seq: str, limits: ResourceLimits | None = None,
+                 cancel: threading.Event | None = None) -> FoldResult:
+    """
+    Calls CdsFold via a subprocess. Returns a CensoredResult if the run exceeds limits.
+    Setting cancel kills the run and raises RunCancelled.
+    """
+    with scratch_dir() as scratch:
+        fasta = make_fasta_file(aa_seq, scratch)
+        # result = subprocess.run([os.path.join(
+        #     path, 'src/CDSfold'), fasta], capture_output=True, text=True, check=False)
+        try:
+            result, mem_b, time_s = call_subprocess(
+                [os.path.join(os.path.abspath(path), 'src/CDSfold'), fasta], limits=limits, cwd=scratch,
+                cancel=cancel)
+        except LimitExceeded as e:
+            return e.result
+
+    check_returncode('CdsFold', result)
+    return parse_output('CdsFold', parse_cdsfold_output, result.stdout, time_s, mem_b)
+
+
+def parse_cdsfold_output(stdout: str) -> FoldResult:
+    """Parses the stdout of CdsFold"""
+    ret = FoldResult()
+    lns = stdout.split('\n')
     ret.rna_seq = lns[-5]
     ret.db = lns[-4]
     ret.mfe = float(lns[-3].split('MFE:')[1].split(' kcal/mol')[0])
     return ret
 
 
-def make_derna_cft_csv(cft: protein.CodonFrequencyTable) -> str:
+def make_derna_cft_csv(cft: protein.CodonFrequencyTable, scratch: str) -> str:
     """Creates a csv file in the format required by DENRA"""
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as file:
+    with open(os.path.join(scratch, 'cft.csv'), 'w', encoding='utf-8') as file:
         for aa in protein.AA_SINGLE_LETTER.values():
             # DERNA doesn't like stop codons
             if aa == '*':
@@ -107,37 +333,40 @@ def make_derna_cft_csv(cft: protein.CodonFrequencyTable) -> str:
     return file.name
 
 
-def call_derna(cft: protein.CodonFrequencyTable, path: str, aa_seq: str, lambda_value: float = 1.0) -> FoldResult:
-    """Calls DERNA via a subprocess"""
-    csv_cft = make_derna_cft_csv(cft)
-    fasta = make_fasta_file(aa_seq)
-    fname = None
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as file:
-        result, mem_b, time_s = call_subprocess([os.path.join(
-            path, 'build/derna'), '-c', csv_cft, '-i', fasta,
-                                                 '-o', file.name,
-                                                 '-m', '1',
-                                                 '-s', '2',
-                                                 '-l', str(lambda_value)])
-        fname = file.name
-
-    # Delete tmp input files
-    os.remove(csv_cft)
-    os.remove(fasta)
-    with open(fname, 'r', encoding='utf-8') as file:
-        lns = file.readlines()
-    # Delete tmp output file
-    os.remove(fname)
-    # Delete garbage file DERNA creates
-    if os.path.exists("dd.txt"):
-        os.remove("dd.txt")
-
-    if result.returncode != 0:
-        raise FoldException(f'DERNA failed with return code: '
-                            f'{result.returncode}, and stderror: {result.stderr}')
-
-    res = FoldResult(time_s=time_s, memory_bytes=mem_b)
-    for ln in lns:
+def call_derna(cft: protein.CodonFrequencyTable, path: str, aa_seq: str, lambda_value: float = 1.0,
+               limits: ResourceLimits | None = None, cancel: threading.Event | None = None) -> FoldResult:
+    """
+    Calls DERNA via a subprocess. Returns a CensoredResult if the run exceeds limits.
+    Setting cancel kills the run and raises RunCancelled.
+    """
+    # DERNA also writes a garbage dd.txt file to its working directory, which is cleaned up with the scratch directory
+    with scratch_dir() as scratch:
+        csv_cft = make_derna_cft_csv(cft, scratch)
+        fasta = make_fasta_file(aa_seq, scratch)
+        fname = os.path.join(scratch, 'out.txt')
+        try:
+            result, mem_b, time_s = call_subprocess([os.path.join(
+                os.path.abspath(path), 'build/derna'), '-c', csv_cft, '-i', fasta,
+                                                     '-o', fname,
+                                                     '-m', '1',
+                                                     '-s', '2',
+                                                     '-l', str(lambda_value)], limits=limits, cwd=scratch,
+                                                     cancel=cancel)
+        except LimitExceeded as e:
+            return e.result
+        output = ''
+        if os.path.exists(fname):
+            with open(fname, 'r', encoding='utf-8') as file:
+                output = file.read()
+
+    check_returncode('DERNA', result)
+    return parse_output('DERNA', parse_derna_output, output, time_s, mem_b)
+
+
+def parse_derna_output(output: str) -> FoldResult:
+    """Parses the output file of DERNA"""
+    res = FoldResult()
+    for ln in output.splitlines():
         if ln.startswith('zuker cai rna:'):
             res.rna_seq = ln[len('zuker cai rna: '):].split('.size')[0].strip()
         elif ln.startswith('Codon Adaptation Index: '):
@@ -149,9 +378,9 @@ def call_derna(cft: protein.CodonFrequencyTable, path: str, aa_seq: str, lambda_
     return res
 
 
-def make_linear_design_cft_csv(cft: protein.CodonFrequencyTable) -> str:
+def make_linear_design_cft_csv(cft: protein.CodonFrequencyTable, scratch: str) -> str:
     """Creates a csv file in the format required by LinearDesign"""
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as file:
+    with open(os.path.join(scratch, 'cft.csv'), 'w', encoding='utf-8') as file:
         file.write('#,,\n')
         for aa in protein.AA_SINGLE_LETTER.values():
             for codon in cft.get_codons(aa):
@@ -159,26 +388,99 @@ def make_linear_design_cft_csv(cft: protein.CodonFrequencyTable) -> str:
     return file.name
 
 
-def call_lineardesign(cft: protein.CodonFrequencyTable, path: str, aa_seq: str, lambda_value: float = 0.0) -> FoldResult:
-    """Calls LinearDesign via a subprocess"""
-    # Change the working directory to the LinearDesign directory since it can't load .so files otherwise
-    orig_path = os.getcwd()
-    csv_cft = make_linear_design_cft_csv(cft)
-    os.chdir(path)
-    result, mem_b, time_s = call_subprocess(
-        ['bin/LinearDesign_2D', str(lambda_value), '0', csv_cft], input_str=aa_seq)
-    os.chdir(orig_path)
-
-    # Clean up tmp file
-    os.remove(csv_cft)
+def call_lineardesign(cft: protein.CodonFrequencyTable, path: str, aa_seq: str, lambda_value: float = 0.0,
+                      limits: ResourceLimits | None = None, cancel: threading.Event | None = None) -> FoldResult:
+    """
+    Calls LinearDesign via a subprocess. Returns a CensoredResult if the run exceeds limits.
+    Setting cancel kills the run and raises RunCancelled.
+    """
+    with scratch_dir() as scratch:
+        csv_cft = make_linear_design_cft_csv(cft, scratch)
+        # LinearDesign loads its .so files and data files relative to its working directory
+        mirror_dir(path, scratch)
+        try:
+            result, mem_b, time_s = call_subprocess(
+                [os.path.join(scratch, 'bin/LinearDesign_2D'), str(lambda_value), '0', csv_cft],
+                input_str=aa_seq, limits=limits, cwd=scratch, env=library_env(os.path.join(path, 'lib')),
+                cancel=cancel)
+        except LimitExceeded as e:
+            return e.result
+
+    check_returncode('LinearDesign', result)
+    return parse_output('LinearDesign', parse_lineardesign_output, result.stdout, time_s, mem_b)
+
+
+def call_lineardesign_batch(cft: protein.CodonFrequencyTable, path: str, aa_seqs: Sequence[str],
+                            lambda_value: float = 0.0,
+                            limits: ResourceLimits | None = None) -> list[FoldResult | FoldException]:
+    """
+    Calls LinearDesign on many sequences, streaming them through as few processes as possible.
+    Returns a result per sequence, in order. A sequence LinearDesign crashes or produces bad output on gets the
+    FoldException for it in place of a result, and the sequences after it are run in a new process.
+    Per-sequence times are not measured: time_s is the time of the process amortised over the sequences it
+    folded, and memory_bytes is the peak memory of the process.
+    limits apply to each process, and every sequence of a process that exceeds them gets its CensoredResult.
+    """
+    with scratch_dir() as scratch:
+        csv_cft = make_linear_design_cft_csv(cft, scratch)
+        mirror_dir(path, scratch)
+        args = [os.path.join(scratch, 'bin/LinearDesign_2D'), str(lambda_value), '0', csv_cft]
+        env = library_env(os.path.join(path, 'lib'))
+
+        def run_batch(seqs: Sequence[str]) -> list[FoldResult | FoldException]:
+            if not seqs:
+                return []
+            try:
+                result, mem_b, time_s = call_subprocess(
+                    args, input_str='\n'.join(seqs) + '\n', limits=limits, cwd=scratch, env=env)
+            except LimitExceeded as e:
+                return [e.result] * len(seqs)
+            blocks = split_lineardesign_output(result.stdout)[:len(seqs)]
+            if result.returncode == 0 and len(blocks) < len(seqs):
+                blocks.extend([''] * (len(seqs) - len(blocks)))
+            res = []
+            for block in blocks:
+                try:
+                    res.append(parse_output('LinearDesign', parse_lineardesign_output, block,
+                                            time_s / len(blocks), mem_b))
+                except FoldException as e:
+                    res.append(e)
+            if result.returncode == 0:
+                return res
+            if len(seqs) == 1:
+                try:
+                    check_returncode('LinearDesign', result)
+                except FoldException as e:
+                    return [e]
+            # The process crashed on the sequence of its last block or on the first one with no output.
+            # The last block may have been cut off, or its sequence may have crashed after printing it,
+            # so that sequence is rerun with the rest rather than trusted
+            res = res[:-1]
+            rest = seqs[len(res):]
+            if res:
+                return res + run_batch(rest)
+            # Output may have been lost in the crash, so narrow down the crashing sequence by halving
+            mid = len(rest) // 2
+            return run_batch(rest[:mid]) + run_batch(rest[mid:])
+
+        return run_batch(list(aa_seqs))
+
+
+def split_lineardesign_output(stdout: str) -> list[str]:
+    """Splits the stdout of LinearDesign run on several sequences into the output of each"""
+    blocks = []
+    for ln in stdout.split("\n"):
+        if ln.startswith('mRNA sequence:  '):
+            blocks.append([])
+        if blocks:
+            blocks[-1].append(ln)
+    return ['\n'.join(block) for block in blocks]
 
-    if result.returncode != 0:
-        raise FoldException(f'LinearDesign failed with return code: '
-                            f'{result.returncode}, and stderror: {result.stderr}')
 
-    # Parse result
-    res = FoldResult(time_s=time_s, memory_bytes=mem_b)
-    for ln in result.stdout.split("\n"):
+def parse_lineardesign_output(stdout: str) -> FoldResult:
+    """Parses the stdout of LinearDesign"""
+    res = FoldResult()
+    for ln in stdout.split("\n"):
         if ln.startswith('mRNA sequence:  '):
             res.rna_seq = ln[len('mRNA sequence:  '):]
         elif ln.startswith('mRNA structure: '):
@@ -191,9 +493,9 @@ def call_lineardesign(cft: protein.CodonFrequencyTable, path: str, aa_seq: str,
     return res
 
 
-def make_mrnafold_config(aa_seq: str, parallel: bool, lambda_value: float) -> str:
+def make_mrnafold_config(aa_seq: str, parallel: bool, lambda_value: float, scratch: str) -> str:
     """Creates a folding configuration file in the format required by MrnaFold"""
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as file:
+    with open(os.path.join(scratch, 'config.txt'), 'w', encoding='utf-8') as file:
         file.write(f'aa_seq {aa_seq}\n')
         file.write(f'parallel {str(parallel).lower()}\n')
         file.write(f'lambda {lambda_value}\n')
@@ -202,22 +504,29 @@ def make_mrnafold_config(aa_seq: str, parallel: bool, lambda_value: float) -> st
     return file.name
 
 
-def call_mrnafold(path: str, aa_seq: str, parallel: bool = True, lambda_value: float = 0.0) -> FoldResult:
-    """Calls mRNAFold via a subprocess"""
-    fname = make_mrnafold_config(aa_seq, parallel, lambda_value)
-    result, mem_b, time_s = call_subprocess(
-        [os.path.join(path, 'build/exe/fold_codon_graph'), fname])
-
-    # Clean up tmp file
-    os.remove(fname)
-
-    if result.returncode != 0:
-        raise FoldException(f'mRNAFold failed with return code: {
-                            result.returncode}, and stderror: {result.stderr}')
-
-    # Parse result
-    res = FoldResult(time_s=time_s, memory_bytes=mem_b)
-    lns = result.stdout.split("\n")
+def call_mrnafold(path: str, aa_seq: str, parallel: bool = True, lambda_value: float = 0.0,
+                  limits: ResourceLimits | None = None, cancel: threading.Event | None = None) -> FoldResult:
+    """
+    Calls mRNAFold via a subprocess. Returns a CensoredResult if the run exceeds limits.
+    Setting cancel kills the run and raises RunCancelled.
+    """
+    with scratch_dir() as scratch:
+        fname = make_mrnafold_config(aa_seq, parallel, lambda_value, scratch)
+        try:
+            result, mem_b, time_s = call_subprocess(
+                [os.path.join(os.path.abspath(path), 'build/exe/fold_codon_graph'), fname],
+                limits=limits, cwd=scratch, cancel=cancel)
+        except LimitExceeded as e:
+            return e.result
+
+    check_returncode('mRNAFold', result)
+    return parse_output('mRNAFold', parse_mrnafold_output, result.stdout, time_s, mem_b)
+
+
+def parse_mrnafold_output(stdout: str) -> FoldResult:
+    """Parses the stdout of mRNAFold"""
+    res = FoldResult()
+    lns = stdout.split("\n")
     res.rna_seq = lns[0]
     res.db = lns[1]
     res.cai = float(lns[3].split('CAI: ')[1])
@@ -226,6 +535,71 @@ def call_mrnafold(path: str, aa_seq: str, parallel: bool = True, lambda_value: f
     return res
 
 
+@dataclass
+class RetryPolicy:
+    """
+    Policy for retrying failed tool runs.
+    Only failures whose kind is in retry_on are retried, for up to max_attempts attempts in total.
+    The wait before retry n is backoff_s * backoff_factor**(n-1), capped at max_backoff_s.
+    Every crashing input is appended to crash_corpus, if given. Runs censored by a resource limit are not crashes.
+    """
+    max_attempts: int = 5
+    backoff_s: float = 1.0
+    backoff_factor: float = 2.0
+    max_backoff_s: float = 60.0
+    retry_on: frozenset[str] = frozenset({FAILURE_ASSERT, FAILURE_SEGFAULT, FAILURE_PARSE, FAILURE_OTHER})
+    crash_corpus: str | None = None
+
+
+@dataclass
+class RetryOutcome:
+    """
+    Outcome of call_with_retries.
+    result is None if every attempt failed. aa_seq is the input of the final attempt.
+    """
+    result: FoldResult | None
+    aa_seq: str
+    attempts: int
+    failures: list[FoldException]
+
+
+def record_crash(path: str, tool: str, aa_seq: str, e: FoldException):
+    """Appends a failing input to the crash corpus csv at path"""
+    new_file = not os.path.exists(path)
+    with open(path, 'a', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(['tool', 'protein', 'kind', 'returncode', 'stderr'])
+        writer.writerow([tool, aa_seq, e.kind, e.returncode, e.stderr.strip()[-500:]])
+
+
+def call_with_retries(tool: str, call: Callable[[str], FoldResult], next_seq: Callable[[], str],
+                      policy: RetryPolicy | None = None) -> RetryOutcome:
+    """
+    Calls call on inputs drawn from next_seq until it succeeds or the policy gives up.
+    next_seq is called once per attempt, so it can return the same sequence or a fresh one.
+    Censored results count as failures of kind FAILURE_TIMEOUT or FAILURE_MEMORY, and are returned as the result
+    if they are not retried.
+    """
+    policy = policy or RetryPolicy()
+    failures = []
+    for attempt in range(1, policy.max_attempts+1):
+        aa_seq = next_seq()
+        try:
+            res = call(aa_seq)
+            if not isinstance(res, CensoredResult):
+                return RetryOutcome(res, aa_seq, attempt, failures)
+            raise LimitExceeded(res)
+        except FoldException as e:
+            failures.append(e)
+            if policy.crash_corpus is not None and not isinstance(e, LimitExceeded):
+                record_crash(policy.crash_corpus, tool, aa_seq, e)
+            if e.kind not in policy.retry_on or attempt == policy.max_attempts:
+                return RetryOutcome(e.result if isinstance(e, LimitExceeded) else None, aa_seq, attempt, failures)
+        time.sleep(min(policy.backoff_s * policy.backoff_factor**(attempt-1), policy.max_backoff_s))
+    raise ValueError('RetryPolicy.max_attempts must be at least 1')
+
+
 def main():
     aa_str = "MLVLVLV"
     print(call_cdsfold("../extern/CDSfold-main", aa_str))
@@ -0,0 +1,170 @@
+"""
+Compact columnar storage for large collections of designs.
+Nucleotides and dot-bracket structures are packed at 2 bits per position, and numeric fields are kept in typed
+arrays. Collections are saved as a directory of .npy files, which are memory mapped on load rather than read.
+"""
+from typing import Iterable, Iterator
+import os
+import numpy as np
+from bridge import FoldResult
+
+NUCLEOTIDES = "ACGU"
+DB_SYMBOLS = ".()"
+
+# Numeric FoldResult fields and the dtype they are stored as
+NUMERIC_FIELDS = {
+    "mfe": np.float64,
+    "cai": np.float64,
+    "time_s": np.float64,
+    "memory_bytes": np.int64,
+}
+
+
+def _make_lut(alphabet: str) -> np.ndarray:
+    lut = np.full(256, 255, dtype=np.uint8)
+    for code, symbol in enumerate(alphabet):
+        lut[ord(symbol)] = code
+    return lut
+
+
+_NT_LUT = _make_lut(NUCLEOTIDES)
+_DB_LUT = _make_lut(DB_SYMBOLS)
+_NT_ALPHABET = np.frombuffer(NUCLEOTIDES.encode("ascii"), dtype=np.uint8)
+_DB_ALPHABET = np.frombuffer(DB_SYMBOLS.encode("ascii"), dtype=np.uint8)
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def encode(s: str, lut: np.ndarray) -> np.ndarray:
+    """Maps each character of s to its 2 bit code, one code per byte"""
+    codes = lut[np.frombuffer(s.encode("ascii"), dtype=np.uint8)]
+    if np.any(codes == 255):
+        raise ValueError(f"Cannot encode {s}")
+    return codes
+
+
+def pack(codes: np.ndarray) -> np.ndarray:
+    """Packs 2 bit codes four to a byte, the first code in the lowest bits"""
+    padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    return np.bitwise_or.reduce(padded.reshape(-1, 4) << _SHIFTS, axis=1).astype(np.uint8)
+
+
+def unpack(packed: np.ndarray, start: int, n: int, alphabet: np.ndarray) -> str:
+    """Decodes the n codes starting at code index start of packed"""
+    block = np.asarray(packed[start // 4:(start + n + 3) // 4])
+    codes = ((block[:, None] >> _SHIFTS) & 3).ravel()[start % 4:start % 4 + n]
+    return alphabet[codes].tobytes().decode("ascii")
+
+
+class DesignRecord:
+    """A read-only view of one design in a DesignCollection"""
+    __slots__ = ("_collection", "_index")
+
+    def __init__(self, collection: "DesignCollection", index: int):
+        self._collection = collection
+        self._index = index
+
+    @property
+    def rna_seq(self) -> str:
+        c = self._collection
+        return unpack(c.seq_packed, int(c.offsets[self._index]), self._len(), _NT_ALPHABET)
+
+    @property
+    def db(self) -> str:
+        c = self._collection
+        return unpack(c.db_packed, int(c.offsets[self._index]), self._len(), _DB_ALPHABET)
+
+    def _len(self) -> int:
+        return int(self._collection.offsets[self._index + 1] - self._collection.offsets[self._index])
+
+    def __getattr__(self, name):
+        if name in NUMERIC_FIELDS:
+            return self._collection.columns[name][self._index].item()
+        raise AttributeError(name)
+
+    def to_fold_result(self) -> FoldResult:
+        return FoldResult(rna_seq=self.rna_seq, db=self.db,
+                          **{name: getattr(self, name) for name in NUMERIC_FIELDS})
+
+    def __repr__(self):
+        return f"DesignRecord({self._index})"
+
+
+class DesignCollection:
+    """
+    A columnar collection of designs.
+    offsets[i]:offsets[i+1] is the range of design i in the packed sequence and structure streams.
+    """
+
+    def __init__(self, offsets: np.ndarray, seq_packed: np.ndarray, db_packed: np.ndarray,
+                 columns: dict[str, np.ndarray]):
+        self.offsets = offsets
+        self.seq_packed = seq_packed
+        self.db_packed = db_packed
+        self.columns = columns
+
+    @classmethod
+    def from_results(cls, results: Iterable[FoldResult]) -> "DesignCollection":
+        lengths = []
+        seq_codes = []
+        db_codes = []
+        values = {name: [] for name in NUMERIC_FIELDS}
+        for res in results:
+            if len(res.rna_seq) != len(res.db):
+                raise ValueError(f"Sequence and structure lengths differ: {res.rna_seq} {res.db}")
+            lengths.append(len(res.rna_seq))
+            seq_codes.append(encode(res.rna_seq, _NT_LUT))
+            db_codes.append(encode(res.db, _DB_LUT))
+            for name in NUMERIC_FIELDS:
+                values[name].append(getattr(res, name))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        empty = np.zeros(0, dtype=np.uint8)
+        return cls(offsets,
+                   pack(np.concatenate(seq_codes) if seq_codes else empty),
+                   pack(np.concatenate(db_codes) if db_codes else empty),
+                   {name: np.array(vals, dtype=dtype) for (name, dtype), vals
+                    in zip(NUMERIC_FIELDS.items(), values.values())})
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> DesignRecord:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return DesignRecord(self, index)
+
+    def __iter__(self) -> Iterator[DesignRecord]:
+        return (DesignRecord(self, i) for i in range(len(self)))
+
+    def pair_table(self, index: int) -> np.ndarray:
+        """The pair table of design index: the 0-based partner of each position, or -1 if it is unpaired"""
+        db = self[index].db
+        table = np.full(len(db), -1, dtype=np.int32)
+        stack = []
+        for i, symbol in enumerate(db):
+            if symbol == "(":
+                stack.append(i)
+            elif symbol == ")":
+                j = stack.pop()
+                table[i], table[j] = j, i
+        return table
+
+    def save(self, path: str):
+        """Saves the collection as a directory of .npy files"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "seq_packed.npy"), self.seq_packed)
+        np.save(os.path.join(path, "db_packed.npy"), self.db_packed)
+        for name, column in self.columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), column)
+
+    @classmethod
+    def load(cls, path: str) -> "DesignCollection":
+        """Loads a saved collection, memory mapping its files read-only instead of reading them"""
+        def load_column(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        return cls(load_column("offsets"), load_column("seq_packed"), load_column("db_packed"),
+                   {name: load_column(name) for name in NUMERIC_FIELDS})
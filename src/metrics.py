@@ -0,0 +1,140 @@
+"""
+Live progress metrics for long benchmark runs.
+Periodically rewrites a file in the Prometheus text exposition format, for the node exporter textfile collector
+or any other scraper, with job counts per tool, the current protein length, the memory of running tools,
+and an ETA from cost curves fitted on the runs completed so far.
+"""
+from typing import Sequence
+import os
+import threading
+import time
+import psutil
+from admission import fit_power_law
+from bridge import CensoredResult, FoldResult
+
+PREFIX = "mrna_bench"
+
+
+class BenchmarkMetrics:
+    """
+    Tracks the progress of a benchmark sweep over tools and protein lengths, and writes it to path every
+    interval_s seconds from a background thread between start() and stop().
+    """
+
+    def __init__(self, path: str, tools: Sequence[str], lengths: Sequence[int], interval_s: float = 5.0):
+        self.path = path
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._pending = {tool: list(lengths) for tool in tools}
+        self._done = {tool: {"ok": 0, "censored": 0, "failed": 0} for tool in tools}
+        self._times = {tool: [] for tool in tools}
+        self._running = {}
+        self._aa_len = 0
+        self._inflight_peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+
+    def start(self):
+        self.write()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+    def job_started(self, tool: str, aa_len: int):
+        with self._lock:
+            if aa_len != self._aa_len:
+                self._inflight_peak = 0
+            self._aa_len = aa_len
+            self._running[tool] = time.time()
+
+    def job_finished(self, tool: str, aa_len: int, res: FoldResult | None):
+        """Records a finished job. res is None if the tool failed"""
+        with self._lock:
+            self._running.pop(tool, None)
+            if aa_len in self._pending[tool]:
+                self._pending[tool].remove(aa_len)
+            if res is None:
+                self._done[tool]["failed"] += 1
+            elif isinstance(res, CensoredResult):
+                self._done[tool]["censored"] += 1
+            else:
+                self._done[tool]["ok"] += 1
+                self._times[tool].append((aa_len, res.time_s))
+                self._inflight_peak = max(self._inflight_peak, res.memory_bytes)
+
+    def tool_stopped(self, tool: str):
+        """Marks a tool as not being run on any of its pending lengths"""
+        with self._lock:
+            self._pending[tool] = []
+
+    def eta_s(self) -> float:
+        """
+        Predicted seconds until the sweep finishes, from a power law of time against length fitted per tool.
+        A tool with pending jobs but no completed ones makes the ETA unknown, which is nan.
+        """
+        with self._lock:
+            eta = 0.0
+            for tool, pending in self._pending.items():
+                if not pending:
+                    continue
+                if not self._times[tool]:
+                    return float("nan")
+                a, b = fit_power_law(self._times[tool])
+                eta += sum(a * aa_len**b for aa_len in pending)
+            # Count the time running jobs have already spent against the ETA
+            now = time.time()
+            eta -= sum(now - started for started in self._running.values())
+            return max(eta, 0.0)
+
+    def _inflight_memory(self) -> int:
+        """Resident memory of every running tool, which are all descendants of this process"""
+        rss = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return rss
+
+    def render(self) -> str:
+        inflight = self._inflight_memory()
+        eta = self.eta_s()
+        with self._lock:
+            self._inflight_peak = max(self._inflight_peak, inflight)
+            lines = []
+
+            def metric(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]):
+                lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+            metric("jobs_done_total", "counter", "Tool runs finished, by outcome", [
+                (f'{{tool="{tool}",outcome="{outcome}"}}', n)
+                for tool, outcomes in self._done.items() for outcome, n in outcomes.items()])
+            metric("jobs_pending", "gauge", "Tool runs not yet finished",
+                   [(f'{{tool="{tool}"}}', len(pending)) for tool, pending in self._pending.items()])
+            metric("job_start_timestamp_seconds", "gauge", "Start time of each running tool run",
+                   [(f'{{tool="{tool}"}}', started) for tool, started in self._running.items()])
+            metric("current_aa_len", "gauge", "Protein length currently being run", [("", self._aa_len)])
+            metric("inflight_memory_bytes", "gauge", "Resident memory of the running tools", [("", inflight)])
+            metric("inflight_peak_memory_bytes", "gauge", "Peak memory of the tool runs at the current length",
+                   [("", self._inflight_peak)])
+            metric("eta_seconds", "gauge", "Predicted seconds until the benchmark finishes", [("", eta)])
+            metric("last_update_timestamp_seconds", "gauge", "Time these metrics were written",
+                   [("", time.time())])
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Atomically replaces the metrics file, so scrapers never read a partial file"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+        os.replace(tmp_path, self.path)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.write()
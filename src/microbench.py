@@ -0,0 +1,178 @@
+"""
+Microbenchmarks for the Python harness layer, run without the external folding binaries.
+Times codon table loading, CAI, the output parsers of each tool, make_bppt, validate_res and the plot_bench
+aggregation on synthetic inputs of several sizes. Parser inputs are the synthetic tool outputs in
+data/microbench_fixtures, scaled up to each size. The fixtures are hand-written in the output format each parser
+expects rather than recorded from the binaries, so replace them with recorded outputs where the binaries are
+available.
+Results are saved per commit in data/microbench, and can be compared against an earlier commit.
+"""
+from contextlib import redirect_stdout
+from typing import Callable
+import argparse as ap
+import json
+import os
+import random
+import subprocess
+import timeit
+import pandas as pd
+import bridge
+import check_all
+import plot_bench
+import protein
+import vienna
+
+FIXTURE_DIR = "../data/microbench_fixtures"
+RESULTS_DIR = "../data/microbench"
+
+PARSERS = {
+    "cdsfold": bridge.parse_cdsfold_output,
+    "lineardesign": bridge.parse_lineardesign_output,
+    "derna": bridge.parse_derna_output,
+    "mrnafold": bridge.parse_mrnafold_output,
+}
+
+
+def time_call(fn: Callable[[], object], repeats: int) -> float:
+    """Returns the best time in seconds of a single call to fn, over repeats rounds"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / number
+
+
+def scale_fixture(tool: str, cft: protein.CodonFrequencyTable, rna_seq: str, db: str, aa_seq: str) -> str:
+    """Returns the fixture output of tool with its design replaced by the given one"""
+    with open(os.path.join(FIXTURE_DIR, f"{tool}_output.txt"), "r", encoding="utf-8") as file:
+        output = file.read()
+    fixture = PARSERS[tool](output)
+    output = output.replace(fixture.rna_seq, rna_seq).replace(fixture.db, db)
+    # Only some tools echo the protein back
+    fixture_aa = "".join(cft.get_aa(codon) for codon in protein.rna_to_cds(fixture.rna_seq))
+    return output.replace(fixture_aa, aa_seq)
+
+
+def make_run_file(rng: random.Random) -> str:
+    """Makes the output of a synthetic benchmark.py run over the usual range of lengths"""
+    lines = []
+    for aa_len in range(50, 1501, 50):
+        lines.append(f"aa_len: {aa_len}")
+        for tool in plot_bench.TIME_DATA_LABELS:
+            tool = tool.split("_")[0]
+            lines.append(f"{tool} time(s): {rng.uniform(0.1, 3600)}")
+            lines.append(f"{tool} memory(bytes): {rng.randint(10**6, 10**11)}")
+    return "\n".join(lines) + "\n"
+
+
+def aggregate_run_files(run_files: list[str]):
+    """The plot_bench aggregation of run files, without the plotting"""
+    parsed_data = [plot_bench.parse_data(raw_data)[0] for raw_data in run_files]
+    df_parsed = pd.DataFrame(parsed_data)
+    for label in plot_bench.TIME_DATA_LABELS + plot_bench.MEM_DATA_LABELS:
+        plot_bench.get_min_max_med(df_parsed, label)
+
+
+def run_benchmarks(sizes: list[int], run_file_counts: list[int], repeats: int) -> dict[str, dict[str, float]]:
+    """Runs every microbenchmark. Returns a map from component to size to seconds per call"""
+    results = {}
+
+    def record(component: str, size: int, fn: Callable[[], object]):
+        results.setdefault(component, {})[str(size)] = time_call(fn, repeats)
+        print(f"{component} size: {size} time(s): {results[component][str(size)]:.3e}", flush=True)
+
+    rng = random.Random(0)
+    random.seed(0)
+    table_path = "../data/homosapiens.txt"
+    record("codon_table_init", 0, lambda: protein.CodonFrequencyTable(table_path))
+    cft = protein.CodonFrequencyTable(table_path)
+
+    for aa_len in sizes:
+        aa_seq = protein.random_aa_seq(aa_len)
+        cds = protein.random_cds(aa_seq, cft)
+        rna_seq = "".join(cds)
+        ctx = vienna.ViennaContext(rna_seq, dangles=0)
+        db = ctx.mfe()
+        mfe = ctx.free_energy(db)
+
+        record("cai", aa_len, lambda: cft.codon_adaptation_index(cds))
+        for tool, parser in PARSERS.items():
+            output = scale_fixture(tool, cft, rna_seq, db, aa_seq)
+            record(f"parse_{tool}", aa_len, lambda: bridge.parse_output(tool, parser, output, 0.0, 0))
+        record("validate_res", aa_len, lambda: check_all.validate_res(rna_seq, mfe, db, 1e-3, "microbench"))
+        bppt_ctx = vienna.ViennaContext(rna_seq)
+        # Compute the partition function up front, so only the table conversion is timed
+        bppt_ctx.ensemble_free_energy()
+        record("make_bppt", aa_len, bppt_ctx.make_bppt)
+
+    run_files = [make_run_file(rng) for _ in range(max(run_file_counts, default=0))]
+    with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+        for count in run_file_counts:
+            results.setdefault("plot_bench_aggregate", {})[str(count)] = time_call(
+                lambda: aggregate_run_files(run_files[:count]), repeats)
+    for count in run_file_counts:
+        print(f"plot_bench_aggregate size: {count} time(s): "
+              f"{results['plot_bench_aggregate'][str(count)]:.3e}", flush=True)
+    return results
+
+
+def current_commit() -> str:
+    """Short hash of the checked out commit, marked dirty if tracked files have uncommitted changes"""
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                            check=True).stdout.strip()
+    status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                            text=True, check=True).stdout.strip()
+    return f"{commit}-dirty" if status else commit
+
+
+def compare(baseline: dict[str, dict[str, float]], current: dict[str, dict[str, float]], threshold: float):
+    """Prints the ratio of current to baseline times, flagging those slower than threshold"""
+    for component, times in current.items():
+        for size, t in times.items():
+            if size not in baseline.get(component, {}):
+                continue
+            ratio = t / baseline[component][size]
+            flag = " REGRESSION" if ratio > threshold else ""
+            print(f"{component} size: {size} ratio: {ratio:.2f}{flag}")
+
+
+def main():
+    parser = ap.ArgumentParser(description="Microbenchmark the Python harness layer")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[30, 150, 500, 1500],
+        help="Protein lengths to benchmark at",
+    )
+    parser.add_argument(
+        "--run_files",
+        nargs="+",
+        type=int,
+        default=[1, 10, 100, 500],
+        help="Numbers of benchmark run files to aggregate",
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="Timing rounds per benchmark. The best is kept")
+    parser.add_argument("--no_save", action="store_true", help="Do not save the results for this commit")
+    parser.add_argument("--compare", type=str, default=None, help="Commit to compare the results against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Slowdown ratio over the compared commit that is reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.run_files, args.repeats)
+    commit = current_commit()
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, f"{commit}.json"), "w", encoding="utf-8") as file:
+            json.dump({"commit": commit, "results": results}, file, indent=2)
+    if args.compare is not None:
+        with open(os.path.join(RESULTS_DIR, f"{args.compare}.json"), "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        print(f"Comparing {commit} against {args.compare}")
+        compare(baseline, results, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
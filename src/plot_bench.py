@@ -4,6 +4,132 @@ import argparse as ap
 import numpy as np
 
 
+TIME_DATA_LABELS = ["lineardesign_time", "cdsfold_time", "derna_time", "mrnafold_time"]
+MEM_DATA_LABELS = ["lineardesign_mem", "cdsfold_mem", "derna_mem", "mrnafold_mem"]
+
+
+def parse_data(raw_data):
+    """
+    Parses the output of benchmark.py.
+    Returns the measured data, the censored runs, which map a data label to (aa_len, limit) pairs, and the
+    failures, which map a tool to (aa_len, failed attempts, attempts) triples.
+    Every data label has a value per aa_len, which is None if the tool failed or was not run at that length
+    """
+    data = {
+        "aa_len": [],
+        "lineardesign_time": [],
+        "cdsfold_time": [],
+        "derna_time": [],
+        "mrnafold_time": [],
+        "lineardesign_mem": [],
+        "cdsfold_mem": [],
+        "derna_mem": [],
+        "mrnafold_mem": [],
+    }
+    censored = {label: [] for label in data if label != "aa_len"}
+    censor_suffix = {"time": "_time", "memory": "_mem"}
+    failures = {label[:-len("_time")]: [] for label in TIME_DATA_LABELS}
+    for line in raw_data.split("\n"):
+        if line.startswith("aa_len:"):
+            data["aa_len"].append(int(line.split(":")[1].strip()))
+            for label in censored:
+                data[label].append(None)
+        elif " censored(" in line:
+            # e.g. "cdsfold censored(time): 3600"
+            tool, rest = line.split(" censored(")
+            limit, value = rest.split("):")
+            censored[tool + censor_suffix[limit]].append((data["aa_len"][-1], float(value.strip())))
+        elif " failures: " in line:
+            # e.g. "lineardesign failures: 3/10 (assert: 3)"
+            tool, rest = line.split(" failures: ")
+            failed, attempts = rest.split()[0].split("/")
+            failures[tool].append((data["aa_len"][-1], int(failed), int(attempts)))
+        elif line.startswith("lineardesign time(s):"):
+            data["lineardesign_time"][-1] = float(line.split(":")[1].strip())
+        elif line.startswith("lineardesign memory(bytes):"):
+            data["lineardesign_mem"][-1] = int(line.split(":")[1].strip())
+        elif line.startswith("cdsfold time(s):"):
+            data["cdsfold_time"][-1] = float(line.split(":")[1].strip())
+        elif line.startswith("cdsfold memory(bytes):"):
+            data["cdsfold_mem"][-1] = int(line.split(":")[1].strip())
+        elif line.startswith("derna time(s):"):
+            data["derna_time"][-1] = float(line.split(":")[1].strip())
+        elif line.startswith("derna memory(bytes):"):
+            data["derna_mem"][-1] = int(line.split(":")[1].strip())
+        elif line.startswith("mrnafold time(s):"):
+            data["mrnafold_time"][-1] = float(line.split(":")[1].strip())
+        elif line.startswith("mrnafold memory(bytes):"):
+            data["mrnafold_mem"][-1] = int(line.split(":")[1].strip())
+        elif line.endswith(" failed"):
+            # The tool failed at this length, so its values stay None
+            continue
+        else:
+            print(f"Skipping line: {line}")
+            continue
+
+    def convert_to_gb(lst):
+        return [None if x is None else x / 1024**3 for x in lst]
+
+    data["lineardesign_mem"] = convert_to_gb(data["lineardesign_mem"])
+    data["cdsfold_mem"] = convert_to_gb(data["cdsfold_mem"])
+    data["derna_mem"] = convert_to_gb(data["derna_mem"])
+    data["mrnafold_mem"] = convert_to_gb(data["mrnafold_mem"])
+    for label in MEM_DATA_LABELS:
+        censored[label] = [(x, v / 1024**3) for x, v in censored[label]]
+    
+    
+    def convert_to_minutes(lst):
+        return [None if x is None else x / 60 for x in lst]
+    
+    data["lineardesign_time"] = convert_to_minutes(data["lineardesign_time"])
+    data["cdsfold_time"] = convert_to_minutes(data["cdsfold_time"])
+    data["derna_time"] = convert_to_minutes(data["derna_time"])
+    data["mrnafold_time"] = convert_to_minutes(data["mrnafold_time"])
+    for label in TIME_DATA_LABELS:
+        censored[label] = [(x, v / 60) for x, v in censored[label]]
+
+    return data, censored, failures
+
+
+def get_min_max_med(df_parsed, label):
+    """Returns the per-length minimum, maximum and median of a data label across all parsed files"""
+    mat = list(df_parsed[label])
+    # Since runs can exceed the timeout at different lengths,
+    # truncate the matrix to the last length every run has a value at
+    mn_len = min(max((i + 1 for i, val in enumerate(row) if val is not None), default=0) for row in mat)
+    mat = [row[:mn_len] for row in mat]
+    # transpose the matrix
+    mat = list(map(list, zip(*mat)))
+    meds = []
+    mins = []
+    maxs = []
+    for row in mat:
+        # Lengths where a run failed are summarised over the other runs, and are nan if every run failed
+        row = sorted(val for val in row if val is not None)
+        meds.append(row[len(row) // 2] if row else np.nan)
+        mins.append(row[0] if row else np.nan)
+        maxs.append(row[-1] if row else np.nan)
+    return mins, maxs, meds
+
+
+def failure_table(parsed_failures):
+    """
+    Tabulates the failures of each tool by length, summed over the parsed files, as "failed/attempts".
+    Lengths where no tool failed are left out
+    """
+    totals = {}
+    for failures in parsed_failures:
+        for tool, pts in failures.items():
+            for aa_len, failed, attempts in pts:
+                prev_failed, prev_attempts = totals.get((aa_len, tool), (0, 0))
+                totals[(aa_len, tool)] = (prev_failed + failed, prev_attempts + attempts)
+    table = pd.DataFrame(
+        {tool: {aa_len: f"{failed}/{attempts}" for (aa_len, t), (failed, attempts) in totals.items() if t == tool}
+         for tool in parsed_failures[0]}
+    )
+    return table.sort_index().fillna("")
+
+
 def main():
     # Parse the arguments
     parser = ap.ArgumentParser(description="Plot the benchmark data")
@@ -36,67 +162,22 @@ def main():
 
     plot_scale = "linear"
 
-    # Function to parse the raw data
-    def parse_data(raw_data):
-        data = {
-            "aa_len": [],
-            "lineardesign_time": [],
-            "cdsfold_time": [],
-            "derna_time": [],
-            "mrnafold_time": [],
-            "lineardesign_mem": [],
-            "cdsfold_mem": [],
-            "derna_mem": [],
-            "mrnafold_mem": [],
-        }
-        for line in raw_data.split("\n"):
-            if line.startswith("aa_len:"):
-                data["aa_len"].append(int(line.split(":")[1].strip()))
-            elif line.startswith("lineardesign time(s):"):
-                data["lineardesign_time"].append(float(line.split(":")[1].strip()))
-            elif line.startswith("lineardesign memory(bytes):"):
-                data["lineardesign_mem"].append(int(line.split(":")[1].strip()))
-            elif line.startswith("cdsfold time(s):"):
-                data["cdsfold_time"].append(float(line.split(":")[1].strip()))
-            elif line.startswith("cdsfold memory(bytes):"):
-                data["cdsfold_mem"].append(int(line.split(":")[1].strip()))
-            elif line.startswith("derna time(s):"):
-                data["derna_time"].append(float(line.split(":")[1].strip()))
-            elif line.startswith("derna memory(bytes):"):
-                data["derna_mem"].append(int(line.split(":")[1].strip()))
-            elif line.startswith("mrnafold time(s):"):
-                data["mrnafold_time"].append(float(line.split(":")[1].strip()))
-            elif line.startswith("mrnafold memory(bytes):"):
-                data["mrnafold_mem"].append(int(line.split(":")[1].strip()))
-            else:
-                print(f"Skipping line: {line}")
-                continue
-
-        def convert_to_gb(lst):
-            return [None if x is None else x / 1024**3 for x in lst]
-
-        data["lineardesign_mem"] = convert_to_gb(data["lineardesign_mem"])
-        data["cdsfold_mem"] = convert_to_gb(data["cdsfold_mem"])
-        data["derna_mem"] = convert_to_gb(data["derna_mem"])
-        data["mrnafold_mem"] = convert_to_gb(data["mrnafold_mem"])
-        
-        
-        def convert_to_minutes(lst):
-            return [None if x is None else x / 60 for x in lst]
-        
-        data["lineardesign_time"] = convert_to_minutes(data["lineardesign_time"])
-        data["cdsfold_time"] = convert_to_minutes(data["cdsfold_time"])
-        data["derna_time"] = convert_to_minutes(data["derna_time"])
-        data["mrnafold_time"] = convert_to_minutes(data["mrnafold_time"])
-
-        return data
+    plot_labels = ["LinearDesign", "CDSfold", "DERNA", "mRNAfold"]
+    markers = ["o", "s", "^", "d"]
+    time_data_labels = TIME_DATA_LABELS
+    mem_data_labels = MEM_DATA_LABELS
 
     # Parse the data
     parsed_data = []
+    parsed_censored = []
+    parsed_failures = []
     for path in args.data:
         file = open(path, "r")
         raw_data = file.read()
-        parsed_data.append(parse_data(raw_data))
+        data, censored, failures = parse_data(raw_data)
+        parsed_data.append(data)
+        parsed_censored.append(censored)
+        parsed_failures.append(failures)
         # Check the same set of aa_len values are used
         if parsed_data[0]["aa_len"] != parsed_data[-1]["aa_len"]:
             print("Mismatch in aa_len values between files. Exiting.")
@@ -105,13 +186,8 @@ def main():
         
     df_parsed = pd.DataFrame(parsed_data)
     print(df_parsed)
-    
-    
-    
-    plot_labels = ["LinearDesign", "CDSfold", "DERNA", "mRNAfold"]
-    markers = ["o", "s", "^", "d"]
-    time_data_labels = ["lineardesign_time", "cdsfold_time", "derna_time", "mrnafold_time"]
-    mem_data_labels = ["lineardesign_mem", "cdsfold_mem", "derna_mem", "mrnafold_mem"]
+    print("Failed attempts by length:")
+    print(failure_table(parsed_failures))
     
     if not args.include_mrnafold:
         plot_labels = plot_labels[:-1]
@@ -119,42 +195,16 @@ def main():
         time_data_labels = time_data_labels[:-1]
         mem_data_labels = mem_data_labels[:-1]
     
-    mins, maxs = df_parsed.min(axis=0), df_parsed.max(axis=0)
-    def get_min_max_med(label):
-        mat = []
-        for row in df_parsed[label]:
-            rvals = []
-            for val in row:
-                if val is not None:
-                    rvals.append(val)
-            mat.append(rvals)
-        # Since runs can exceed the timeout at different lengths,
-        # truncate the matrix to the minimum length
-        mn_len = min(map(len, mat))
-        mat = [row[:mn_len] for row in mat]
-        # transpose the matrix
-        mat = list(map(list, zip(*mat)))
-        meds = []
-        mins = []
-        maxs = []
-        for row in mat:
-            row.sort()
-            meds.append(row[len(row) // 2])
-            mins.append(row[0])
-            maxs.append(row[-1])
-        return mins, maxs, meds
-            
-    
     def make_plot(data_labels):
         plt.figure(figsize=(12, 8))
         for i, plot_label in enumerate(plot_labels):
             marker = markers[i]
             data_label = data_labels[i]
-            mins, maxs, y = get_min_max_med(data_label)
+            mins, maxs, y = get_min_max_med(df_parsed, data_label)
             mins, maxs, y = np.array(mins), np.array(maxs), np.array(y)
             x = df_parsed["aa_len"][0][:len(y)]
             yerr = np.array([y - mins, maxs - y])
-            plt.errorbar(
+            line = plt.errorbar(
                 x,
                 y,
                 yerr=yerr,
@@ -167,6 +217,17 @@ def main():
                 markeredgecolor='black',
                 markeredgewidth=1 
             )
+            # Runs killed at a resource limit are drawn at the limit, since their true value is at least that
+            censored = [pt for run in parsed_censored for pt in run[data_label]]
+            if censored:
+                cx, cy = zip(*censored)
+                plt.scatter(
+                    cx,
+                    cy,
+                    label=f"{plot_label} (censored)",
+                    marker="x",
+                    color=line[0].get_color(),
+                )
         
     
     # Plot the time data
@@ -107,7 +107,7 @@ def random_aa_seq(length: int) -> str:
 def random_cds(aa_seq, freq_table):
     cds = []
     for aa in aa_seq:
-        cds.append(random.choice(list(freq_table.aa_to_codons[aa])))
+        cds.append(random.choice(list(freq_table.get_codons(aa))))
     return cds
 
 def rna_to_cds(rna_seq):
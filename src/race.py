@@ -0,0 +1,169 @@
+"""
+Race mode for the exact mRNA folding tools.
+CDSfold, DERNA (lambda 1) and mRNAfold (lambda 0) all find the exact MFE design, so they are launched together on
+a protein and the first result that checks out against ViennaRNA is taken; the other runs are killed.
+The winning tool is logged by length so that routing can be tuned.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+import argparse as ap
+import csv
+import os
+import random
+import threading
+import pandas as pd
+from bridge import (
+    call_cdsfold,
+    call_derna,
+    call_mrnafold,
+    CensoredResult,
+    FoldException,
+    FoldResult,
+    ResourceLimits,
+    RunCancelled,
+)
+import protein
+import vienna
+
+EXACT_TOOLS = ["cdsfold", "derna", "mrnafold"]
+
+
+@dataclass
+class RaceResult:
+    """
+    Outcome of a race. winner is None if no tool produced a verified result.
+    rejected maps each tool that finished without winning to why it was rejected.
+    """
+    winner: str | None
+    result: FoldResult | None
+    rejected: dict[str, str]
+
+
+def verify(cft: protein.CodonFrequencyTable, aa_seq: str, res: FoldResult, eps: float = 1e-3) -> str | None:
+    """
+    Checks a design codes for aa_seq, and that its structure and MFE agree with ViennaRNA.
+    Returns None if it does, and otherwise the reason it does not.
+    """
+    if len(res.rna_seq) != 3 * len(aa_seq) or len(res.db) != len(res.rna_seq):
+        return "wrong length"
+    for aa, codon in zip(aa_seq, protein.rna_to_cds(res.rna_seq)):
+        if codon not in cft.get_codons(aa):
+            return f"{codon} does not code for {aa}"
+    ctx = vienna.ViennaContext(res.rna_seq, dangles=0)
+    if abs(ctx.free_energy(res.db) - res.mfe) >= eps:
+        return "structure energy does not match MFE"
+    if abs(ctx.mfe_energy() - res.mfe) >= eps:
+        return "MFE does not match ViennaRNA"
+    return None
+
+
+def race(cft: protein.CodonFrequencyTable, bin_root: str, aa_seq: str, tools: list[str] | None = None,
+         limits: ResourceLimits | None = None, eps: float = 1e-3) -> RaceResult:
+    """Runs the exact tools on aa_seq at the same time, and returns the first verified result"""
+    tools = tools or EXACT_TOOLS
+    cancel = threading.Event()
+    tool_calls = {
+        "cdsfold": lambda: call_cdsfold(
+            os.path.join(bin_root, "CDSfold-main"), aa_seq, limits=limits, cancel=cancel
+        ),
+        "derna": lambda: call_derna(
+            cft, os.path.join(bin_root, "derna-main"), aa_seq, lambda_value=1.0, limits=limits, cancel=cancel
+        ),
+        "mrnafold": lambda: call_mrnafold(
+            os.path.join(bin_root, "mrnafold-main"), aa_seq, lambda_value=0.0, limits=limits, cancel=cancel
+        ),
+    }
+
+    winner = None
+    result = None
+    rejected = {}
+    # Leaving the executor waits for the cancelled runs to be killed and their scratch directories removed
+    with ThreadPoolExecutor(max_workers=len(tools)) as executor:
+        futures = {executor.submit(tool_calls[tool]): tool for tool in tools}
+        for future in as_completed(futures):
+            tool = futures[future]
+            try:
+                res = future.result()
+            except RunCancelled:
+                continue
+            except FoldException as e:
+                rejected[tool] = f"failed: {e.kind}"
+                continue
+            if isinstance(res, CensoredResult):
+                rejected[tool] = f"censored: {res.limit}"
+                continue
+            reason = verify(cft, aa_seq, res, eps)
+            if reason is not None:
+                rejected[tool] = reason
+                continue
+            if winner is None:
+                winner, result = tool, res
+                cancel.set()
+    return RaceResult(winner, result, rejected)
+
+
+def log_winner(path: str, aa_seq: str, race_res: RaceResult):
+    """Appends the winner of a race to the csv log at path"""
+    new_file = not os.path.exists(path)
+    with open(path, "a", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(["aa_len", "winner", "time_s"])
+        writer.writerow([len(aa_seq), race_res.winner or "", race_res.result.time_s if race_res.result else ""])
+
+
+def win_rates(path: str) -> pd.DataFrame:
+    """Fraction of races each tool won, by protein length. Races no tool won are counted under 'none'"""
+    df = pd.read_csv(path, keep_default_na=False)
+    df["winner"] = df["winner"].replace("", "none")
+    return pd.crosstab(df["aa_len"], df["winner"], normalize="index")
+
+
+def main():
+    parser = ap.ArgumentParser(description="Race the exact mRNA folding tools on random proteins")
+    parser.add_argument(
+        "--lengths",
+        nargs="+",
+        type=int,
+        default=[50, 100, 200, 400],
+        help="Protein lengths to race on",
+    )
+    parser.add_argument("--races", type=int, default=10, help="Number of races per length")
+    parser.add_argument(
+        "--timeout", type=int, default=3600, help="Timeout in seconds for each tool run"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for random sequences")
+    parser.add_argument(
+        "--codon_table",
+        type=str,
+        default="../data/homosapiens.txt",
+        help="Path to the codon frequency table",
+    )
+    parser.add_argument(
+        "--bin_root",
+        type=str,
+        default="../extern/",
+        help="Root directory for the binaries. Where the mRNA folding programs are located",
+    )
+    parser.add_argument(
+        "--log",
+        type=str,
+        default="../data/race_winners.csv",
+        help="Path to the csv file the winner of each race is appended to",
+    )
+    args = parser.parse_args()
+
+    cft = protein.CodonFrequencyTable(args.codon_table)
+    random.seed(args.seed)
+    limits = ResourceLimits(time_s=args.timeout)
+    for aa_len in args.lengths:
+        for _ in range(args.races):
+            aa_seq = protein.random_aa_seq(aa_len)
+            race_res = race(cft, args.bin_root, aa_seq, limits=limits)
+            log_winner(args.log, aa_seq, race_res)
+            print(f"aa_len: {aa_len} winner: {race_res.winner} rejected: {race_res.rejected}", flush=True)
+    print(win_rates(args.log))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Thread-scaling study for the parallel-capable mRNA folding tools.
+Reruns tools on fixed sequences pinned to 1, 2, 4, ... N cores, and reports the speedup,
+parallel efficiency and Karp-Flatt serial fraction at each core count.
+"""
+from bridge import (
+    call_cdsfold,
+    call_mrnafold,
+    call_lineardesign,
+    call_derna,
+    CensoredResult,
+    FoldException,
+    ResourceLimits,
+)
+from collections import Counter
+import random
+import statistics
+import protein
+import argparse as ap
+import os
+
+
+def core_counts(max_cores: int) -> list[int]:
+    """Powers of two up to max_cores, always ending with max_cores itself"""
+    counts = []
+    p = 1
+    while p < max_cores:
+        counts.append(p)
+        p *= 2
+    counts.append(max_cores)
+    return counts
+
+
+def scaling_metrics(t1: float, tp: float, p: int) -> tuple[float, float, float]:
+    """
+    Returns the speedup, parallel efficiency and Karp-Flatt serial fraction of a run taking
+    tp seconds on p cores, relative to t1 seconds on one core.
+    The serial fraction is undefined for a single core, so it is nan when p is 1.
+    """
+    speedup = t1 / tp
+    efficiency = speedup / p
+    if p == 1:
+        return speedup, efficiency, float("nan")
+    serial_fraction = (1 / speedup - 1 / p) / (1 - 1 / p)
+    return speedup, efficiency, serial_fraction
+
+
+def main():
+    # Parse command line arguments
+    parser = ap.ArgumentParser(description="Measure how the mRNA folding tools scale with cores")
+    parser.add_argument(
+        "--tools",
+        nargs="+",
+        default=["mrnafold"],
+        choices=["lineardesign", "cdsfold", "derna", "mrnafold"],
+        help="Tools to run the scaling study on",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="random",
+        choices=["random", "mll"],
+        help="Kind of sequence to run on",
+    )
+    parser.add_argument(
+        "--lengths",
+        nargs="+",
+        type=int,
+        default=[250, 500, 1000],
+        help="Protein lengths to run on",
+    )
+    parser.add_argument(
+        "--max_cores",
+        type=int,
+        default=len(os.sched_getaffinity(0)),
+        help="Largest number of cores to run on. Defaults to every core available",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="Number of runs per core count. The median time is used"
+    )
+    parser.add_argument(
+        "--timeout", type=int, default=3600, help="Timeout in seconds for each tool run"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for random sequences")
+    parser.add_argument(
+        "--codon_table",
+        type=str,
+        default="../data/homosapiens.txt",
+        help="Path to the codon frequency table",
+    )
+    parser.add_argument(
+        "--bin_root",
+        type=str,
+        default="../extern/",
+        help="Root directory for the binaries. Where the mRNA folding programs are located",
+    )
+    args = parser.parse_args()
+
+    cft = protein.CodonFrequencyTable(args.codon_table)
+    random.seed(args.seed)
+    available_cpus = sorted(os.sched_getaffinity(0))
+    assert 1 <= args.max_cores <= len(available_cpus), (
+        f"max_cores must be between 1 and {len(available_cpus)}"
+    )
+
+    tool_calls = {
+        "lineardesign": lambda seq, limits: call_lineardesign(
+            cft, os.path.join(args.bin_root, "LinearDesign-main/"), seq, limits=limits
+        ),
+        "cdsfold": lambda seq, limits: call_cdsfold(
+            os.path.join(args.bin_root, "CDSfold-main"), seq, limits=limits
+        ),
+        "derna": lambda seq, limits: call_derna(
+            cft, os.path.join(args.bin_root, "derna-main"), seq, lambda_value=1.0, limits=limits
+        ),
+        "mrnafold": lambda seq, limits: call_mrnafold(
+            os.path.join(args.bin_root, "mrnafold-main"), seq, parallel=True, limits=limits
+        ),
+    }
+
+    for aa_len in args.lengths:
+        print("aa_len:", aa_len)
+        aa_seq = protein.random_aa_seq(aa_len) if args.mode == "random" else "M" + "L" * (aa_len - 1)
+        for tool in args.tools:
+            t1 = None
+            for p in core_counts(args.max_cores):
+                limits = ResourceLimits(time_s=args.timeout, cpus=available_cpus[:p])
+                results = []
+                failures = []
+                for _ in range(args.repeats):
+                    try:
+                        results.append(tool_calls[tool](aa_seq, limits))
+                    except FoldException as e:
+                        failures.append(e)
+                if failures:
+                    # A failed repeat leaves too few timings for a fair median, so the core count is skipped
+                    kinds = Counter(e.kind for e in failures)
+                    print(
+                        f"{tool} cores: {p} failures: {len(failures)}/{args.repeats}",
+                        f"({', '.join(f'{k}: {n}' for k, n in sorted(kinds.items()))})",
+                        flush=True,
+                    )
+                    continue
+                censored = [res for res in results if isinstance(res, CensoredResult)]
+                if censored:
+                    print(f"{tool} cores: {p} censored({censored[0].limit}):", censored[0].limit_value, flush=True)
+                    continue
+                tp = statistics.median(res.time_s for res in results)
+                if p == 1:
+                    t1 = tp
+                if t1 is None:
+                    # No single core baseline to compare against
+                    print(f"{tool} cores: {p} time(s): {tp}", flush=True)
+                    continue
+                speedup, efficiency, serial_fraction = scaling_metrics(t1, tp, p)
+                print(
+                    f"{tool} cores: {p} time(s): {tp} speedup: {speedup:.3f} "
+                    f"efficiency: {efficiency:.3f} serial_fraction: {serial_fraction:.3f}",
+                    flush=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,38 @@
+from dataclasses import dataclass, asdict
+from multiprocessing import Pool
+from typing import Sequence
+import pandas as pd
 import RNA
 
 
+def make_model_details(temp=None, dangles=2, noLPs=False):
+    md = RNA.md()
+    md.uniq_ML = 1
+    md.dangles = dangles
+    md.noLP = noLPs
+    if temp is not None:
+        md.temperature = temp
+    return md
+
+
 class ViennaContext:
-    def __init__(self, rna, temp=None, dangles=2, noLPs=False) -> None:
-        md = RNA.md()
-        md.uniq_ML = 1
-        md.dangles = dangles
-        md.noLP = noLPs
-        if temp is not None:
-            md.temperature = temp
+    # md, if given, is a prebuilt model (see make_model_details) used in place of temp, dangles and noLPs
+    def __init__(self, rna, temp=None, dangles=2, noLPs=False, md=None) -> None:
+        if md is None:
+            md = make_model_details(temp, dangles, noLPs)
         self.fc = RNA.fold_compound(rna, md)
         self.pf_computed = False
+        self.mfe_result = None
+
+    def __ensure_mfe(self):
+        if self.mfe_result is None:
+            self.mfe_result = self.fc.mfe()
+        return self.mfe_result
 
     def __ensure_pf(self):
         if self.pf_computed:
             return
-        _, mfe_energy = self.fc.mfe()
+        _, mfe_energy = self.__ensure_mfe()
         self.fc.exp_params_rescale(mfe_energy)
         _, efe = self.fc.pf()
         self.efe = efe
@@ -56,9 +73,82 @@ class ViennaContext:
         return self.fc.ensemble_defect(ss)
 
     def mfe(self):
-        return self.fc.mfe()[0]
+        return self.__ensure_mfe()[0]
+
+    def mfe_energy(self):
+        return self.__ensure_mfe()[1]
 
     def psample(self, samples=1, redundant=True):
         self.__ensure_pf()
         return self.fc.pbacktrack(samples, RNA.PBACKTRACK_DEFAULT if redundant else RNA.PBACKTRACK_NON_REDUNDANT)
 
+
+@dataclass(frozen=True)
+class ModelCondition:
+    """An energy model condition to evaluate designs under. A temp of None is the ViennaRNA default of 37C"""
+    temp: float | None = None
+    dangles: int = 2
+    noLPs: bool = False
+
+    def model_details(self):
+        return make_model_details(self.temp, self.dangles, self.noLPs)
+
+
+# Models built once per worker process, in the same order as the conditions they were built from
+_worker_models = []
+
+
+def _init_worker(conditions):
+    global _worker_models
+    _worker_models = [cond.model_details() for cond in conditions]
+
+
+def _evaluate_design(task):
+    design, seq, db = task
+    rows = []
+    for cond_idx, md in enumerate(_worker_models):
+        ctx = ViennaContext(seq, md=md)
+        rows.append({
+            'design': design,
+            'condition': cond_idx,
+            'mfe': ctx.mfe_energy(),
+            'structure_energy': ctx.free_energy(db),
+            'ensemble_free_energy': ctx.ensemble_free_energy(),
+            'ensemble_defect': ctx.ensemble_defect(db),
+        })
+    return rows
+
+
+def evaluate_conditions(designs: Sequence[tuple[str, str]], conditions: Sequence[ModelCondition],
+                        processes: int = 1, chunksize: int = 16) -> pd.DataFrame:
+    """
+    Evaluates every (sequence, structure) design under every model condition.
+    Models are built once per condition in each worker process and reused across all designs.
+    Returns a tidy table with one row per design and condition, holding the condition's fields, the MFE,
+    the free energy of the design's structure, the ensemble free energy and the design's ensemble defect.
+    """
+    tasks = [(i, seq, db) for i, (seq, db) in enumerate(designs)]
+    if processes == 1:
+        _init_worker(conditions)
+        rows = [row for task in tasks for row in _evaluate_design(task)]
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(conditions,)) as pool:
+            rows = [row for rows in pool.imap(_evaluate_design, tasks, chunksize) for row in rows]
+    table = pd.DataFrame(rows, columns=['design', 'condition', 'mfe', 'structure_energy',
+                                        'ensemble_free_energy', 'ensemble_defect'])
+    # Record the temperature each model actually uses, so the default condition is not left as NaN
+    cond_table = pd.DataFrame([{**asdict(cond), 'temp': cond.model_details().temperature} for cond in conditions])
+    cond_table['condition'] = range(len(conditions))
+    return table.merge(cond_table, on='condition').sort_values(['design', 'condition'], ignore_index=True)
+
+
+def condition_robustness(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarises an evaluate_conditions table per design: the worst ensemble defect over all conditions,
+    and the spread of the structure's free energy across conditions.
+    """
+    grouped = table.groupby('design')
+    return pd.DataFrame({
+        'worst_ensemble_defect': grouped['ensemble_defect'].max(),
+        'structure_energy_range': grouped['structure_energy'].max() - grouped['structure_energy'].min(),
+    })